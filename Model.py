@@ -1,5 +1,298 @@
 # Contains code for the system model
 import numpy
+import numba
+import scipy.integrate
+import scipy.linalg
+import scipy.optimize
+
+# The type of numba compiled functions, which moved to numba.core in numba 0.49
+_Dispatcher = getattr(numba, 'core', numba).dispatcher.Dispatcher
+
+# Dissociation constants used in the charge balance
+K_FA1, K_FA2, K_A, K_B, K_W = 10 ** (-3.03), 10 ** 4.44, 10 ** 8.08, 10 ** 0.56, 10 ** (-14)
+
+
+def _charge_balance(pH, C_fa, C_a, C_b):
+    """The charge balance in the vessel for a given pH.
+
+    Parameters
+    ----------
+    pH : float
+        The pH at which the balance is evaluated
+
+    C_fa, C_a, C_b : float
+        The concentrations of fumaric acid, acid and base
+
+    Returns
+    -------
+    balance : float
+        The net charge in the vessel, which is zero at the true pH
+    """
+    Ch = 10.0 ** -pH
+    C_fa_minus = K_FA1 * C_fa / (K_FA1 + Ch)
+    C_fa_minus2 = K_FA2 * C_fa_minus / (K_FA2 + Ch)
+    C_cl_minus = K_A * C_a / (K_A + Ch)
+    C_oh_minus = K_W / Ch
+    C_na_plus = K_B * C_b / (K_B + C_oh_minus)
+
+    balance = Ch + C_na_plus - C_fa_minus - C_fa_minus2 - C_cl_minus - C_oh_minus
+    return balance
+
+
+def _solve_pH(C_fa, C_a, C_b):
+    """Solves the charge balance for the pH.
+
+    Parameters
+    ----------
+    C_fa, C_a, C_b : float
+        The concentrations of fumaric acid, acid and base
+
+    Returns
+    -------
+    pH : float
+        The pH at which the charge balance is zero
+    """
+    concentrations = C_fa, C_a, C_b
+    try:
+        pH = scipy.optimize.brentq(_charge_balance, 0.0, 14.0, args=concentrations, xtol=1e-6)
+    except ValueError:
+        # The charge balance does not change sign on [0, 14] so the closest end point is used
+        lower, upper = _charge_balance(0.0, *concentrations), _charge_balance(14.0, *concentrations)
+        pH = 0.0 if abs(lower) < abs(upper) else 14.0
+
+    return pH
+
+
+def _rate_matrix():
+    """The matrix of rate equations described in `Model.DEs`"""
+    alpha, PO, gamma, theta, beta = 0.1, 0.1, 1.8, 0.1, 0.1
+    return numpy.array([[1, 0, 0, 0, 0],
+                        [0, 0, 0, 1, 0],
+                        [0, 0, 0, 0, 1],
+                        [-6, 4, 7/3, 2, -gamma],
+                        [0, 12, -1, 0, beta]])
+
+
+# The inverse of the rate matrix as a C-contiguous float64 array, solved once from its LU factorisation.
+# It is shared by all the models, so it is read only
+_RATE_MATRIX_INV = numpy.ascontiguousarray(
+    scipy.linalg.lu_solve(scipy.linalg.lu_factor(_rate_matrix()), numpy.eye(5)), dtype=numpy.float64)
+_RATE_MATRIX_INV.flags.writeable = False
+
+
+# nnan and ninf are left out of fastmath since a clipped V or Vg gives inf and nan like numpy does
+@numba.njit(cache=True, fastmath={'nsz', 'arcp', 'contract', 'afn', 'reassoc'}, error_model='numpy')
+def _DEs_core(X, U, Rinv, out):
+    """Compiled kernel for the differential and algebraic equations of the system model.
+    See `Model.DEs` for a description of the rate equations.
+    The differential changes are written into `out` so that no tuple has to be boxed on return.
+
+    Parameters
+    ----------
+    X : array_like
+        The current states
+
+    U : tuple
+        The current inputs as a tuple of floats
+
+    Rinv : 2d array_like
+        The inverse of the rate matrix
+
+    out : array_like
+        The array into which the differential changes to the state variables are written
+    """
+    Ng = max(0.0, X[0])
+    Nx = max(0.0, X[1])
+    Nfa = max(0.0, X[2])
+    Ne = max(0.0, X[3])
+    Nco = max(0.0, X[4])
+    No = max(0.0, X[5])
+    Nn = max(0.0, X[6])
+    Na = max(0.0, X[7])
+    Nb = max(0.0, X[8])
+    Nz = max(0.0, X[9])
+    Ny = max(0.0, X[10])
+    V = max(0.0, X[11])
+    Vg = max(0.0, X[12])
+    T = max(0.0, X[13])
+    Fg_in, Cg_in, Fco_in, Cco_in, Fo_in, Co_in, \
+        Fg_out, Cn_in, Fn_in, Fb_in, Cb_in, Fm_in, Fout, Tamb, Q = U
+
+    alpha, PO, gamma, theta, beta = 0.1, 0.1, 1.8, 0.1, 0.1
+    delta = 0.2
+
+    # Concentrations
+    invV, invVg = 1.0/V, 1.0/Vg
+    Cg, Cx, Cfa, Ce, Cn = Ng*invV, Nx*invV, Nfa*invV, Ne*invV, Nn*invV
+    Ca, Cb, Cz, Cy = Na*invV, Nb*invV, Nz*invV, Ny*invV
+    Cco, Co = Nco*invVg, No*invVg
+
+    first_increase = (0.6 / 46 / 25 * 4) * Cy * 1.8
+    second_increase = 2/46/120*3.2
+    decrease = (0.6 / 46 / 40*3) * Cz/3
+    # Branchless so that the ensemble kernel can vectorise across members
+    rZ = (decrease + second_increase) * (Cz > 0.0)  # decrease
+    rY = (first_increase + decrease) * (Cy > 0.0)  # increase
+
+    monod_e = Cg / (1e-5 + Cg)
+    rFAf = 15e-3 * (Cg / (1e-2 + Cg)) - 0.5 * rZ
+    rEf = (second_increase + rY) * monod_e
+    theta_calc = theta * (Cg / (1e-3 + Cg))
+    R0, R1, R2, R3, R4 = rFAf, rEf, 8e-5, theta_calc, 0.0
+
+    # Unrolled Rinv @ RHS
+    rFAf = Rinv[0, 0]*R0 + Rinv[0, 1]*R1 + Rinv[0, 2]*R2 + Rinv[0, 3]*R3 + Rinv[0, 4]*R4
+    rTCA = Rinv[1, 0]*R0 + Rinv[1, 1]*R1 + Rinv[1, 2]*R2 + Rinv[1, 3]*R3 + Rinv[1, 4]*R4
+    rResp = Rinv[2, 0]*R0 + Rinv[2, 1]*R1 + Rinv[2, 2]*R2 + Rinv[2, 3]*R3 + Rinv[2, 4]*R4
+    rEf = Rinv[3, 0]*R0 + Rinv[3, 1]*R1 + Rinv[3, 2]*R2 + Rinv[3, 3]*R3 + Rinv[3, 4]*R4
+    rbio = Rinv[4, 0]*R0 + Rinv[4, 1]*R1 + Rinv[4, 2]*R2 + Rinv[4, 3]*R3 + Rinv[4, 4]*R4
+
+    rG = -rFAf - rTCA - rEf - rbio
+    rX = 6 * rbio
+    rFA = 2*(rFAf + 0.5 * rZ)
+    rE = 2 * (rEf - rZ) * monod_e
+    rCO = -2 * rFAf + 6 * rTCA + 2 * rEf + alpha * rbio
+    rO = -0.5*rResp
+
+    # DE's
+    out[0] = Fg_in*Cg_in - Fout*Cg + rG*Cx*V  # dNg
+    out[1] = rX*Cx*V  # dNx
+    out[2] = -Fout*Cfa + rFA*Cx*V  # dNfa
+    out[3] = -Fout*Ce + rE*Cx*V  # dNe
+    out[4] = Fco_in*Cco_in - Fg_out*Cco + rCO*Cx*V  # dNco
+    out[5] = Fo_in*Co_in - Fg_out*Co - rO*Cx*V  # dNo
+    out[6] = Fn_in*Cn_in - Fout*Cn - delta*rX*Cx*V  # dNn
+    out[7] = - Fout * Ca  # dNa
+    out[8] = Fb_in*Cb_in - Fout*Cb  # dNb
+    out[9] = -190*rZ*Cx*V  # dNz
+    out[10] = -95*rY*Cx*V  # dNy
+    out[11] = Fg_in + Fn_in + Fb_in + Fm_in - Fout  # dV
+    out[12] = Fco_in + Fo_in - Fg_out  # dVg
+    out[13] = 4.5*Q - 0.25*(T - Tamb)  # dT
+
+
+# Largest |lambda*h| used for the RK4 substeps of `ensemble_step`, half of the real axis stability limit of 2.785
+_RK4_MAX_LAMBDA_H = 1.4
+# Upper bound on the substeps of `ensemble_step`, which members with a non-positive V or Vg would otherwise exceed
+_RK4_MAX_SUBSTEPS = 1000
+
+
+@numba.guvectorize(['void(f8[:], f8[:], f8[:, :], f8, f8[:, :], f8[:])'], '(n),(m),(p,p),(),(w,n)->(n)',
+                   cache=True)
+def ensemble_step(X, U, Rinv, dt, work, X_new):
+    """Advances an ensemble of states over a time step of the model DEs with fixed RK4 substeps.
+    The inputs are held constant over the step.
+    The step is split into enough substeps to keep RK4 stable for the gas and liquid outflows and the temperature,
+    which are the fastest dynamics of the model.
+    Broadcasts over the leading axes so that a `(K, 14)` array of states is advanced in a single call.
+
+    Parameters
+    ----------
+    X : array_like
+        The current states
+
+    U : array_like
+        The current inputs
+
+    Rinv : 2d array_like
+        The inverse of the rate matrix
+
+    dt : float
+        Time step
+
+    work : 2d array_like
+        A `(5, n)` scratch array for the stage state and the four slopes, which is overwritten.
+        It is allocated once by the caller and broadcast to all the members, which are advanced one after another
+
+    Returns
+    -------
+    X_new : array_like
+        The states after the step
+    """
+    n = X.shape[0]
+    X_stage, k1, k2, k3, k4 = work[0], work[1], work[2], work[3], work[4]
+
+    # Decay rates of the gas outflow (Fg_out / Vg), the liquid outflow (Fout / V) and the temperature
+    rate = max(U[6] / max(X[12], 1e-12), U[12] / max(X[11], 1e-12), 0.25)
+    n_sub = max(1, min(_RK4_MAX_SUBSTEPS, int(numpy.ceil(dt * rate / _RK4_MAX_LAMBDA_H))))
+    h = dt / n_sub
+
+    for i in range(n):
+        X_new[i] = X[i]
+    for _ in range(n_sub):
+        _DEs_core(X_new, U, Rinv, k1)
+        for i in range(n):
+            X_stage[i] = X_new[i] + 0.5 * h * k1[i]
+        _DEs_core(X_stage, U, Rinv, k2)
+        for i in range(n):
+            X_stage[i] = X_new[i] + 0.5 * h * k2[i]
+        _DEs_core(X_stage, U, Rinv, k3)
+        for i in range(n):
+            X_stage[i] = X_new[i] + h * k3[i]
+        _DEs_core(X_stage, U, Rinv, k4)
+        for i in range(n):
+            X_new[i] += h / 6 * (k1[i] + 2 * k2[i] + 2 * k3[i] + k4[i])
+        # Nz and Ny are consumed at a rate that only switches off at zero, which a fixed step overshoots
+        X_new[9] = max(X_new[9], 0.0)
+        X_new[10] = max(X_new[10], 0.0)
+
+
+def _compile_rhs(inputs):
+    """Builds a numba compiled right hand side that evaluates `inputs` and `_DEs_core` together
+    so that no Python objects are created per evaluation.
+    The result is stored on `inputs` so that it is only compiled once and is freed together with it.
+
+    Parameters
+    ----------
+    inputs : numba dispatcher
+        A numba compiled function that takes in the current time and returns a tuple of the current inputs
+
+    Returns
+    -------
+    rhs : numba dispatcher
+        A compiled function taking `(t, X, Rinv, out)` that writes the differential changes
+        to the state variables into `out`
+    """
+    rhs = getattr(inputs, '_model_rhs', None)
+    if rhs is None:
+        @numba.njit
+        def rhs(t, X, Rinv, out):
+            _DEs_core(X, inputs(t), Rinv, out)
+        inputs._model_rhs = rhs
+    return rhs
+
+
+def _depletion_event(i):
+    """An event function for `scipy.integrate.solve_ivp` that is zero when state `i` is depleted.
+    The rates of Nz and Ny switch off at zero, which LSODA cannot step across, so the integration is stopped there
+
+    Parameters
+    ----------
+    i : int
+        The index of the state
+
+    Returns
+    -------
+    event : callable
+        A terminal event function of `(t, X)` for state `i`
+    """
+    def event(t, X):
+        return X[i]
+    event.index = i
+    event.terminal = True
+    event.direction = -1
+    return event
+
+
+# Nz and Ny, the states whose rates switch off when they are depleted
+_DEPLETION_EVENTS = {i: _depletion_event(i) for i in (9, 10)}
+
+# Evaluations of the DEs after which `Model.step` gives up, about ten times what a single 200 h step needs
+_MAX_RHS_CALLS = 20000
+
+
+# Number of rows that the history buffers of `Model` start with
+_INITIAL_HISTORY = 16
 
 
 class Model:
@@ -11,7 +304,9 @@ class Model:
         Initial states
 
     inputs : callable
-        Must take in a parameter t (the current time) and return an array_like of the current inputs
+        Must take in a parameter t (the current time) and return an array_like of the current inputs.
+        If this is a `numba.njit` function returning a tuple of floats, the inputs and the DEs
+        are evaluated together in compiled code
 
     t : float, optional
         Initial time.
@@ -35,25 +330,30 @@ class Model:
     pH_calculations : bool
         If `True` then pH calculations are made
 
-    rate_matrix_inv : 2d array_like
-        The inverse of the rate matrix.
-        Placed here so that it is only calculated once
+    rate_matrix_inv : 2d numpy.ndarray
+        The inverse of the rate matrix as a C-contiguous float64 array.
+        Solved once at import from the LU factorisation of the rate matrix and shared by all models, so it is read only
     """
     def __init__(self, X0, inputs, t=0, pH_calculations=False):
-        self.X = numpy.array(X0)
+        self.X = numpy.array(X0, dtype=numpy.float64)
+        self._dX = numpy.empty(len(self.X))
         self.inputs = inputs
+        if isinstance(inputs, _Dispatcher):
+            self._compiled_rhs = _compile_rhs(inputs)
+        else:
+            self._compiled_rhs = None
         self.t = t
         self.pH_calculations = pH_calculations
 
-        self._Xs = [self.outputs()]
+        # Only the states are stored while stepping, the pH of each row is calculated when it is first requested.
+        # The buffers start small since e.g. the sigma point models of the state estimator only take one step,
+        # and `_record` doubles them as needed
+        self._X_hist = numpy.empty((_INITIAL_HISTORY, len(self.X)))
+        self._pH_hist = numpy.empty(_INITIAL_HISTORY)
+        self._n_steps = 0
+        self._record()
 
-        alpha, PO, gamma, theta, beta = 0.1, 0.1, 1.8, 0.1, 0.1
-        rate_matrix = numpy.array([[1, 0, 0, 0, 0],
-                                   [0, 0, 0, 1, 0],
-                                   [0, 0, 0, 0, 1],
-                                   [-6, 4, 7/3, 2, -gamma],
-                                   [0, 12, -1, 0, beta]])
-        self.rate_matrix_inv = numpy.linalg.inv(rate_matrix)
+        self.rate_matrix_inv = _RATE_MATRIX_INV
 
     def DEs(self, t):
         """Contains the differential and algebraic equations for the system model.
@@ -73,105 +373,121 @@ class Model:
 
         Returns
         -------
-        dX : array_like
+        dX : numpy.ndarray
             The differential changes to the state variables
         """
-        Ng, Nx, Nfa, Ne, Nco, No, Nn, Na, Nb, Nz, Ny, V, Vg, T = [max(0, N) for N in self.X]
-        Fg_in, Cg_in, Fco_in, Cco_in, Fo_in, Co_in, \
-            Fg_out, Cn_in, Fn_in, Fb_in, Cb_in, Fm_in, Fout, Tamb, Q = self.inputs(t)
-
-        alpha, PO, gamma, theta, beta = 0.1, 0.1, 1.8, 0.1, 0.1
-        delta = 0.2
-
-        # Concentrations
-        Cg, Cx, Cfa, Ce, Cn, Ca, Cb, Cz, Cy = [N/V for N in [Ng, Nx, Nfa, Ne, Nn, Na, Nb, Nz, Ny]]
-        Cco, Co = [N/Vg for N in [Nco, No]]
-
-        first_increase = (0.6 / 46 / 25 * 4) * Cy * 1.8
-        second_increase = 2/46/120*3.2
-        decrease = (0.6 / 46 / 40*3) * Cz/3
-        rZ = decrease + second_increase if Cz > 0 else 0  # decrease
-        rY = first_increase + decrease if Cy > 0 else 0  # increase
-
-        rFAf = 15e-3 * (Cg / (1e-2 + Cg)) - 0.5 * rZ
-        rEf = (second_increase + rY) * (Cg / (1e-5 + Cg))
-        theta_calc = theta * (Cg / (1e-3 + Cg))
-        RHS = [rFAf, rEf, 8e-5, theta_calc, 0]
-
-        rFAf, rTCA, rResp, rEf, rbio = self.rate_matrix_inv @ RHS
-
-        rG = -rFAf - rTCA - rEf - rbio
-        rX = 6 * rbio
-        rFA = 2*(rFAf + 0.5 * rZ)
-        rE = 2 * (rEf - rZ) * (Cg / (1e-5 + Cg))
-        rCO = -2 * rFAf + 6 * rTCA + 2 * rEf + alpha * rbio
-        rO = -0.5*rResp
-
-        # DE's
-        dNg = Fg_in*Cg_in - Fout*Cg + rG*Cx*V
-        dNx = rX*Cx*V
-        dNfa = -Fout*Cfa + rFA*Cx*V
-        dNe = -Fout*Ce + rE*Cx*V
-        dNco = Fco_in*Cco_in - Fg_out*Cco + rCO*Cx*V
-        dNo = Fo_in*Co_in - Fg_out*Co - rO*Cx*V
-        dNn = Fn_in*Cn_in - Fout*Cn - delta*rX*Cx*V
-        dNa = - Fout * Ca
-        dNb = Fb_in*Cb_in - Fout*Cb
-        dNz = -190*rZ*Cx*V
-        dNy = -95*rY*Cx*V
-        dV = Fg_in + Fn_in + Fb_in + Fm_in - Fout
-        dVg = Fco_in + Fo_in - Fg_out
-        dT = 4.5*Q - 0.25*(T - Tamb)
-
-        return dNg, dNx, dNfa, dNe, dNco, dNo, dNn, dNa, dNb, dNz, dNy, dV, dVg, dT
+        return self._rhs_for_ode(t, self.X).copy()
+
+    def _rhs_for_ode(self, t, X):
+        """The right hand side of the model as a function of `(t, X)`, as used by `scipy.integrate.solve_ivp`.
+        The result is written into and returned as the shared `_dX` buffer, which callers must copy"""
+        if self._compiled_rhs is not None:
+            self._compiled_rhs(t, X, self.rate_matrix_inv, self._dX)
+        else:
+            U = tuple(float(u) for u in self.inputs(t))
+            _DEs_core(X, U, self.rate_matrix_inv, self._dX)
+        return self._dX
 
     def step(self, dt):
-        """Updates the model with inputs
+        """Updates the model with inputs by integrating the DEs over the step with LSODA.
+        The integration is stopped and restarted where Nz or Ny is depleted, since their rates switch off there
 
         Parameters
         ----------
         dt : float
             Time since previous step
 
+        Raises
+        ------
+        RuntimeError
+            If V or Vg is not positive, the DEs are not finite at the start of the step,
+            or LSODA fails or needs more than `_MAX_RHS_CALLS` evaluations of the DEs.
+            The state and time are left unchanged
         """
+        self.X[:] = self._integrate(self.X, self.t, dt)
         self.t += dt
-        dX = self.DEs(self.t)
-        self.X += numpy.array(dX)*dt
-        self._Xs.append(self.outputs())
+        self._record()
+
+    def _integrate(self, X, t, dt):
+        """Integrates the DEs from `X` at `t` over `dt`
 
-    def calculate_pH(self):
+        Parameters
+        ----------
+        X : numpy.ndarray
+            The states at the start of the interval
+
+        t : float
+            The time at the start of the interval
+
+        dt : float
+            The length of the interval
+
+        Returns
+        -------
+        X_new : numpy.ndarray
+            The states at the end of the interval
+        """
+        # A volume of zero or less gives infinite or undefined concentrations, which LSODA never gets past
+        if not (X[11] > 0 and X[12] > 0):
+            raise RuntimeError("Cannot integrate with the volumes V={} and Vg={}".format(X[11], X[12]))
+        if not numpy.all(numpy.isfinite(self._rhs_for_ode(t, X))):
+            raise RuntimeError("The DEs are not finite at t={} for the states {}".format(t, X))
+
+        # Nearly empty volumes are so stiff that LSODA would take ever smaller steps, so the work is bounded
+        t_start, t_end = t, t + dt
+        calls = 0
+
+        def rhs(t_i, X_i):
+            nonlocal calls
+            calls += 1
+            if calls > _MAX_RHS_CALLS:
+                raise RuntimeError("LSODA did not integrate from t={} to t={} within {} evaluations".format(
+                    t_start, t_end, _MAX_RHS_CALLS))
+            return self._rhs_for_ode(t_i, X_i)
+
+        while True:
+            # Only the states that can still be depleted are watched, a depleted state no longer changes
+            events = [event for i, event in _DEPLETION_EVENTS.items() if X[i] > 0]
+            sol = scipy.integrate.solve_ivp(rhs, (t, t_end), X, method='LSODA',
+                                            atol=1e-8, rtol=1e-6, events=events)
+            if sol.status == -1:
+                raise RuntimeError("LSODA failed to integrate from t={} to t={}: {}".format(t, t_end, sol.message))
+            X = sol.y[:, -1].copy()
+            if sol.status == 0:
+                return X
+
+            t = sol.t[-1]
+            for event, t_events in zip(events, sol.t_events):
+                if len(t_events):
+                    X[event.index] = 0.0
+
+    def _record(self):
+        """Stores the current state in the history buffers, doubling their size when they are full"""
+        if self._n_steps == self._X_hist.shape[0]:
+            self._X_hist = numpy.resize(self._X_hist, (2 * self._X_hist.shape[0], self._X_hist.shape[1]))
+            self._pH_hist = numpy.resize(self._pH_hist, 2 * self._pH_hist.shape[0])
+        self._X_hist[self._n_steps] = self.X
+        self._pH_hist[self._n_steps] = numpy.nan
+        self._n_steps += 1
+
+    def calculate_pH(self, X=None):
         """Calculates the pH in the vessel.
 
+        Parameters
+        ----------
+        X : array_like, optional
+            The states for which the pH is calculated.
+            Defaults to the current state
+
         Returns
         -------
         pH : float
             The pH of the tank
         """
-        K_fa1, K_fa2,  K_a, K_b, K_w = 10 ** (-3.03), 10 ** 4.44, 10 ** 8.08, 10 ** 0.56, 10 ** (-14)
-        _, _, Nfa, _, _, _, _, Na, Nb, _, _, V, _, _ = self.X
-        C_fa = Nfa/V
-        C_a = Na/V
-        C_b = Nb/V
-
-        def charge_balance(pH_guess):
-            Ch = 10 ** (-pH_guess)
-            C_fa_minus = K_fa1 * C_fa / (K_fa1 + Ch)
-            C_fa_minus2 = K_fa2 * C_fa_minus / (K_fa2 + Ch)
-            C_cl_minus = K_a * C_a / (K_a + Ch)
-            C_oh_minus = K_w / Ch
-            C_na_plus = K_b * C_b / (K_b + C_oh_minus)
-
-            balance = Ch + C_na_plus - C_fa_minus - C_fa_minus2 - C_cl_minus - C_oh_minus
-            return balance
-
-        pHs = numpy.linspace(0, 14, 100)
-        CBs = charge_balance(pHs)
-        index = numpy.argmin(abs(CBs))
-        pH = pHs[index]
-        if abs(CBs[index]) > 1e-1:
-            print('ph CB:', CBs[index])
-
-        return pH
+        if X is None:
+            X = self.X
+        V = X[11]
+        return _solve_pH(X[2] / V, X[7] / V, X[8] / V)
 
     def outputs(self):
         """Returns all the outputs (state and calculated)
@@ -189,9 +505,95 @@ class Model:
         return outs
 
     def get_Xs(self):
-        """Gets all the states that are stored"""
-        return numpy.array(self._Xs)
+        """Gets all the states that are stored.
+        The result is a view of the history buffer and is not copied"""
+        return self._X_hist[:self._n_steps]
+
+    def get_pH_history(self, indices=None):
+        """Gets the pH for the stored states.
+        The pH of a state is only calculated the first time it is requested
+
+        Parameters
+        ----------
+        indices : int, slice or array_like, optional
+            The rows of the stored states for which the pH is wanted.
+            Defaults to all of them
+
+        Returns
+        -------
+        pHs : numpy.ndarray
+            The pH for each requested row
+        """
+        pHs = self._pH_hist[:self._n_steps]
+        rows = numpy.arange(self._n_steps)
+        if indices is not None:
+            rows = rows[indices]
+
+        # The concentrations of fumaric acid, acid and base of all the missing rows are calculated together
+        missing = numpy.atleast_1d(rows)[numpy.isnan(pHs[rows]).ravel()]
+        Nfa, Na, Nb, V = self._X_hist[missing][:, [2, 7, 8, 11]].T
+        for i, C_fa, C_a, C_b in zip(missing, Nfa / V, Na / V, Nb / V):
+            pHs[i] = _solve_pH(C_fa, C_a, C_b)
+        return pHs[rows]
 
     def get_data(self):
         """Gets all relevant information from the object """
+        if self.pH_calculations:
+            return numpy.column_stack([self.get_Xs(), self.get_pH_history()])
         return self.get_Xs()
+
+
+class ModelEnsemble:
+    """An ensemble of nonlinear models of the system that share their inputs.
+    The states are stored in a single `(K, 14)` array and advanced together by `ensemble_step`,
+    using fixed RK4 substeps instead of integrating each member with LSODA.
+    The inputs are held constant over each step and the substeps do not stop where a rate switches off,
+    so the members can differ from `Model` by a few percent for steps of an hour or more
+
+    Parameters
+    ----------
+    X0s : 2d array_like
+        Initial states, one row per ensemble member
+
+    inputs : callable
+        Must take in a parameter t (the current time) and return an array_like of the current inputs
+
+    t : float, optional
+        Initial time.
+        Defaults to zero
+
+    Attributes
+    -----------
+    X : 2d numpy.ndarray
+        Array of current states, one row per ensemble member
+
+    inputs : callable
+        Must take in a parameter t (the current time) and return an array_like of the current inputs
+
+    t : float
+        Current time
+
+    rate_matrix_inv : 2d numpy.ndarray
+        The inverse of the rate matrix as a C-contiguous float64 array, shared by all members
+    """
+    def __init__(self, X0s, inputs, t=0):
+        self.X = numpy.array(X0s, dtype=numpy.float64, ndmin=2)
+        self.inputs = inputs
+        self.t = t
+
+        self.rate_matrix_inv = _RATE_MATRIX_INV
+        # Scratch space of `ensemble_step`, shared by all the members
+        self._work = numpy.empty((5, self.X.shape[-1]))
+
+    def step(self, dt):
+        """Updates all the models with inputs.
+        The inputs are evaluated once, at the middle of the step
+
+        Parameters
+        ----------
+        dt : float
+            Time since previous step
+        """
+        U = numpy.asarray(self.inputs(self.t + 0.5 * dt), dtype=numpy.float64)
+        ensemble_step(self.X, U, self.rate_matrix_inv, dt, self._work, self.X)
+        self.t += dt
@@ -111,12 +111,9 @@ class StateEstimator:
             self.inputs = inputs
 
         def __call__(self, x, dt):
-            ts = numpy.linspace(0, dt, int(dt*5 + 2))
-            dt_small = ts[1]
-            m_f = Model.Model(x, self.inputs)
-            m_f.t = self.t
-            for _ in ts:
-                m_f.step(dt_small)
+            # The model integrator controls its own step size, so the whole period is a single step
+            m_f = Model.Model(x, self.inputs, t=self.t)
+            m_f.step(dt)
             return m_f.X
 
     def step(self, dt):
@@ -17,6 +17,9 @@ class FakeInputs:
     """
     def __init__(self, glucose_data_file):
         self.glucose = pandas.read_csv(glucose_data_file)
+        # Plain arrays for the lookup, since the model integrator calls the inputs several times per step
+        self._ts = self.glucose['Time'].values
+        self._CgFgs = self.glucose['Glucose dosing (g/h)'].values
 
     def __call__(self, t):
         Cg_in = 314.19206 / 180  # (g/L) / (g/mol) = mol/L
@@ -54,7 +57,9 @@ class FakeInputs:
         t : float
             The value of time at which the input should be looked up
         """
-        return numpy.interp(t, self.glucose['Time'], self.glucose['Glucose dosing (g/h)'])  # g/h
+        # Only the bracketing interval is passed to interp, which would otherwise scan the whole file per call
+        lower = max(numpy.searchsorted(self._ts, t) - 1, 0)
+        return numpy.interp(t, self._ts[lower:lower + 2], self._CgFgs[lower:lower + 2])  # g/h
 
 
 class LabviewInputs:
@@ -1,10 +1,72 @@
+import functools
+import os
+import tempfile
 import matplotlib.pyplot as plt
+import numpy
 import pandas
 import scipy.stats
 import Model
 import StateEstimator
 import stateUpdaters
 
+# Glucose, fumaric acid, ethanol, Z and Y columns and the weights that convert them to the plotted concentrations
+_CONC_NAMES = ['Ng', 'Nfa', 'Ne', 'Nz', 'Ny']
+_CONC_INDICES = [0, 2, 3, 9, 10]
+_CONC_WEIGHTS = numpy.array([180., 116., 46., 1., 1.])
+
+
+@functools.lru_cache(maxsize=8)
+def _ppf(confidence):
+    """Cached standard deviation multiplier for a confidence interval, since `plot_live` needs it every frame"""
+    return scipy.stats.norm.ppf(confidence)
+
+
+def _read_sheets(file_name):
+    """Reads all the sheets from an Excel file.
+    The sheets are cached in an HDF5 store next to the file (`file_name + '.h5'`),
+    which is used instead of parsing the Excel file again while it is newer than the file.
+    The cache is written to a temporary file and moved into place, and failing to read or write it is not an error.
+
+    Parameters
+    ----------
+    file_name : string
+        The name of the Excel file
+
+    Returns
+    -------
+    sheets : dict
+        A `pandas.DataFrame` for each sheet, keyed by sheet name
+    """
+    cache_name = file_name + '.h5'
+    if os.path.exists(cache_name) and os.path.getmtime(cache_name) >= os.path.getmtime(file_name):
+        try:
+            with pandas.HDFStore(cache_name, 'r') as store:
+                return {key.lstrip('/'): store[key] for key in store.keys()}
+        except (OSError, ImportError, RuntimeError, ValueError):
+            # A corrupt cache (PyTables raises a RuntimeError for those) or a missing PyTables
+            # falls back to the Excel file, and the cache is written again below
+            pass
+
+    sheets = pandas.read_excel(file_name, sheet_name=None)
+
+    temp_name = None
+    try:
+        fd, temp_name = tempfile.mkstemp(suffix='.h5', dir=os.path.dirname(os.path.abspath(cache_name)))
+        os.close(fd)
+        with pandas.HDFStore(temp_name, 'w') as store:
+            for name, sheet in sheets.items():
+                store[name] = sheet
+        os.replace(temp_name, cache_name)
+    except (OSError, ImportError):
+        # The cache is only an optimisation, so e.g. a read-only directory or a missing PyTables is ignored
+        if temp_name is not None and os.path.exists(temp_name):
+            os.remove(temp_name)
+    return sheets
+
+
+# The persistent lines of each figure used by `plot_live`
+_live_lines = {}
+
 
 # noinspection DuplicatedCode
 def plot_all(file_name, confidence=0.95, show=True):
@@ -24,40 +86,27 @@ def plot_all(file_name, confidence=0.95, show=True):
         Useful to turn off when you want to add additional things
         Defaults to `True`
     """
-    xls = pandas.ExcelFile(file_name)
-    model = pandas.read_excel(xls, 'model')
-    se = pandas.read_excel(xls, 'se')
-    su = pandas.read_excel(xls, 'su')
+    sheets = _read_sheets(file_name)
+    model, se, su = sheets['model'], sheets['se'], sheets['su']
 
     # Model
     ts_m = model['ts']
-    Vs_m = model['V']
-    Cgs_m = model['Ng'] * 180 / Vs_m
-    Cfas_m = model['Nfa'] * 116 / Vs_m
-    Ces_m = model['Ne'] * 46 / Vs_m
-    Czs_m = model['Nz'] / Vs_m
-    Cys_m = model['Ny'] / Vs_m
+    Vs_m = model['V'].values
+    Cgs_m, Cfas_m, Ces_m, Czs_m, Cys_m = (model[_CONC_NAMES].values * (_CONC_WEIGHTS / Vs_m[:, None])).T
     Ts_m = model['T']
     pH_m = model['pH']
 
     # SE means
     ts = se['ts']
-    Vs = se['V']
-    Cgs = se['Ng'] * 180 / Vs
-    Cfas = se['Nfa'] * 116 / Vs
-    Ces = se['Ne'] * 46 / Vs
-    Czs = se['Nz'] / Vs
-    Cys = se['Ny'] / Vs
+    Vs = se['V'].values
+    Cgs, Cfas, Ces, Czs, Cys = (se[_CONC_NAMES].values * (_CONC_WEIGHTS / Vs[:, None])).T
     Ts = se['T']
 
     # Standard deviation multiplier to get the correct confidence interval
-    K = scipy.stats.norm.ppf(confidence)
+    K = _ppf(confidence)
     # SE covs
-    Pgs = se['Ng_cov'] * 180 / Vs * K
-    Pfas = se['Nfa_cov'] * 116 / Vs * K
-    Pes = se['Ne_cov'] * 46 / Vs * K
-    Pzs = se['Nz_cov'] / Vs * K
-    Pys = se['Ny_cov'] / Vs * K
+    cov_names = [name + '_cov' for name in _CONC_NAMES]
+    Pgs, Pfas, Pes, Pzs, Pys = (se[cov_names].values * (_CONC_WEIGHTS * K / Vs[:, None])).T
     PTs = se['T_cov']
 
     # Measured update values
@@ -154,33 +203,21 @@ def plot_live(ts,
     # Model
     # 'ts', 'Ng', 'Nx', 'Nfa', 'Ne', 'Nco', 'No', 'Nn', 'Na', 'Nb', 'Nz', 'Ny', 'V', 'Vg', 'T', 'pH'
     Vs_m = model[:, 11]
-    Cgs_m = model[:, 0] * 180 / Vs_m
-    Cfas_m = model[:, 2] * 116 / Vs_m
-    Ces_m = model[:, 3] * 46 / Vs_m
-    Czs_m = model[:, 9] / Vs_m
-    Cys_m = model[:, 10] / Vs_m
+    Cgs_m, Cfas_m, Ces_m, Czs_m, Cys_m = (model[:, _CONC_INDICES] * (_CONC_WEIGHTS / Vs_m[:, None])).T
     Ts_m = model[:, 13]
     pH_m = model[:, 14]
     ts_m = ts[:len(Vs_m)]
 
     # SE means
     Vs = se[:, 11]
-    Cgs = se[:, 0] * 180 / Vs_m
-    Cfas = se[:, 2] * 116 / Vs_m
-    Ces = se[:, 3] * 46 / Vs_m
-    Czs = se[:, 9] / Vs_m
-    Cys = se[:, 10] / Vs_m
+    Cgs, Cfas, Ces, Czs, Cys = (se[:, _CONC_INDICES] * (_CONC_WEIGHTS / Vs_m[:, None])).T
     Ts = se[:, 13]
     ts = ts_m
 
     # Standard deviation multiplier to get the correct confidence interval
-    K = scipy.stats.norm.ppf(confidence)
+    K = _ppf(confidence)
     # SE covs
-    Pgs = se[:, 14 + 0] * 180 / Vs * K
-    Pfas = se[:, 14 + 2] * 116 / Vs * K
-    Pes = se[:, 14 + 3] * 46 / Vs * K
-    Pzs = se[:, 14 + 9] / Vs * K
-    Pys = se[:, 14 + 10] / Vs * K
+    Pgs, Pfas, Pes, Pzs, Pys = (se[:, [14 + i for i in _CONC_INDICES]] * (_CONC_WEIGHTS * K / Vs[:, None])).T
     PTs = se[:, 14 + 13]
 
     # Measured update values
@@ -190,54 +227,47 @@ def plot_live(ts,
     Cfa_meas = su[:, 1][:len(ts_meas)]
     Ce_meas = su[:, 2][:len(ts_meas)]
 
-    plt.subplot(3, 2, 1)
-    plt.cla()
-    plt.plot(ts_m, Cgs_m, "--")
-    plt.plot(ts, Cgs + Pgs)
-    plt.plot(ts, Cgs - Pgs)
-    plt.plot(ts_meas, Cg_meas, '.')
-    plt.title("Glucose")
-
-    plt.subplot(3, 2, 2)
-    plt.cla()
-    plt.plot(ts_m, Cfas_m, "--")
-    plt.plot(ts, Cfas + Pfas)
-    plt.plot(ts, Cfas - Pfas)
-    plt.plot(ts_meas, Cfa_meas, '.')
-    plt.title("Fumaric")
-
-    plt.subplot(3, 2, 3)
-    plt.cla()
-    plt.plot(ts_m, Ces_m, "--")
-    plt.plot(ts, Ces + Pes)
-    plt.plot(ts, Ces - Pes)
-    plt.plot(ts_meas, Ce_meas, '.')
-    plt.title("Ethanol")
-
-    plt.subplot(3, 2, 4)
-    plt.cla()
-    plt.plot(ts_m, Czs_m, "--")
-    plt.plot(ts, Czs + Pzs, label="Z+")
-    plt.plot(ts, Czs - Pzs, label="Z-")
-
-    plt.plot(ts_m, Cys_m, "--")
-    plt.plot(ts, Cys + Pys, label="Y+")
-    plt.plot(ts, Cys - Pys, label="Y-")
-    plt.title("Enzyme")
-    plt.legend()
-
-    plt.subplot(3, 2, 5)
-    plt.cla()
-    plt.plot(ts_m, Ts_m, "--")
-    plt.plot(ts, Ts + PTs)
-    plt.plot(ts, Ts - PTs)
-    plt.title("Temperature")
-
-    plt.subplot(3, 2, 6)
-    plt.cla()
-    plt.plot(ts_m, pH_m)
-    plt.title("pH")
-
+    # (title, [(x, y, fmt, label), ...]) for each subplot
+    panels = [
+        ("Glucose", [(ts_m, Cgs_m, "--", None), (ts, Cgs + Pgs, "-", None), (ts, Cgs - Pgs, "-", None),
+                     (ts_meas, Cg_meas, '.', None)]),
+        ("Fumaric", [(ts_m, Cfas_m, "--", None), (ts, Cfas + Pfas, "-", None), (ts, Cfas - Pfas, "-", None),
+                     (ts_meas, Cfa_meas, '.', None)]),
+        ("Ethanol", [(ts_m, Ces_m, "--", None), (ts, Ces + Pes, "-", None), (ts, Ces - Pes, "-", None),
+                     (ts_meas, Ce_meas, '.', None)]),
+        ("Enzyme", [(ts_m, Czs_m, "--", None), (ts, Czs + Pzs, "-", "Z+"), (ts, Czs - Pzs, "-", "Z-"),
+                    (ts_m, Cys_m, "--", None), (ts, Cys + Pys, "-", "Y+"), (ts, Cys - Pys, "-", "Y-")]),
+        ("Temperature", [(ts_m, Ts_m, "--", None), (ts, Ts + PTs, "-", None), (ts, Ts - PTs, "-", None)]),
+        ("pH", [(ts_m, pH_m, "-", None)]),
+    ]
+
+    # The lines are created on the first frame and only have their data updated afterwards,
+    # which is much cheaper than clearing and replotting the axes
+    fig = plt.gcf()
+    if fig not in _live_lines:
+        _live_lines[fig] = [None] * len(panels)
+        # Closed figures are dropped so that the cache does not keep them alive
+        fig.canvas.mpl_connect('close_event', lambda event: _live_lines.pop(fig, None))
+    cached = _live_lines[fig]
+    for i, (title, specs) in enumerate(panels):
+        ax, lines = cached[i] if cached[i] is not None else (None, [])
+        if ax in fig.axes and all(line in ax.lines for line in lines):
+            for line, (x, y, _, _) in zip(lines, specs):
+                line.set_data(x, y)
+            ax.relim()
+            ax.autoscale_view()
+        else:
+            # The panel is new or has been cleared since the last frame, e.g. by plt.clf() or plt.cla(),
+            # so only this panel is drawn again
+            ax = plt.subplot(3, 2, i + 1)
+            ax.cla()
+            lines = [ax.plot(x, y, fmt, label=label)[0] for x, y, fmt, label in specs]
+            ax.set_title(title)
+            if any(label for _, _, _, label in specs):
+                ax.legend()
+            cached[i] = ax, lines
+
+    fig.canvas.draw_idle()
     plt.pause(0.001)
 
 
@@ -254,8 +284,7 @@ def plot_data(file_name, show=True):
         Useful to turn off when you want to add additional things
         Defaults to `True`
     """
-    xls = pandas.ExcelFile(file_name)
-    su = pandas.read_excel(xls, 'su')
+    su = _read_sheets(file_name)['su']
 
     # Measured update values
     ts_meas = su['ts']
@@ -295,19 +324,13 @@ def plot_model(file_name,  show=True):
         Useful to turn off when you want to add additional things
         Defaults to `True`
     """
-    xls = pandas.ExcelFile(file_name)
-    model = pandas.read_excel(xls, 'model')
-    se = pandas.read_excel(xls, 'se')
-    su = pandas.read_excel(xls, 'su')
+    sheets = _read_sheets(file_name)
+    model, se, su = sheets['model'], sheets['se'], sheets['su']
 
     # Model
     ts_m = model['ts']
-    Vs_m = model['V']
-    Cgs_m = model['Ng'] * 180 / Vs_m
-    Cfas_m = model['Nfa'] * 116 / Vs_m
-    Ces_m = model['Ne'] * 46 / Vs_m
-    Czs_m = model['Nz'] / Vs_m
-    Cys_m = model['Ny'] / Vs_m
+    Vs_m = model['V'].values
+    Cgs_m, Cfas_m, Ces_m, Czs_m, Cys_m = (model[_CONC_NAMES].values * (_CONC_WEIGHTS / Vs_m[:, None])).T
     Ts_m = model['T']
     pH_m = model['pH']
 
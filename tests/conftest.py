@@ -0,0 +1,22 @@
+# Makes the modules in the repository root importable from the tests and holds the shared fixtures
+import os
+import sys
+import numpy
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import inputters  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def inputs():
+    """The glucose feed of `simulation.py`, which is only read from its file once"""
+    return inputters.FakeInputs(os.path.join(ROOT, 'data', 'run_9_glucose.csv'))
+
+
+@pytest.fixture
+def X0():
+    """The initial state of `simulation.py`, as a fresh array for every test"""
+    return numpy.array([0, 4.6/24.6, 0, 0, 0, 0, 0, 1e-5, 0, 5.1, 1.2, 1.077, 0.1, 25])
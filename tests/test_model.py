@@ -0,0 +1,51 @@
+import numba
+import numpy
+from Model import Model
+
+
+def test_DEs_with_zero_volume(inputs, X0):
+    """A liquid volume of zero, e.g. for a clipped UKF sigma point, gives numpy division results instead of raising"""
+    X = X0.copy()
+    X[11] = 0
+    m = Model(X, inputs)
+    dX = m.DEs(0)
+
+    Fg_in, _, Fco_in, _, Fo_in, _, Fg_out, _, Fn_in, Fb_in, _, Fm_in, F_out, T_amb, Q = inputs(0)
+    # Na / V is infinite, which only flows out
+    assert dX[7] == -numpy.inf
+    # Nb / V is 0 / 0
+    assert numpy.isnan(dX[8])
+    # The volumes and the temperature do not depend on the concentrations
+    numpy.testing.assert_allclose(dX[11:], [Fg_in + Fn_in + Fb_in + Fm_in - F_out, Fco_in + Fo_in - Fg_out,
+                                            4.5*Q - 0.25*(X0[13] - T_amb)])
+
+
+def _python_inputs(t):
+    """Inputs with a glucose feed that changes with time"""
+    Fg_in = 1e-3 * (1 + numpy.sin(t))
+    return Fg_in, 1.7, 0.02, 8.7, 0.24, 21., 0.26, 0.1, 1e-4, 6e-5, 10., 0., Fg_in + 1.6e-4, 25., 5 / 9
+
+
+_compiled_inputs = numba.njit(_python_inputs)
+
+
+def test_compiled_inputs(X0):
+    """An njit inputs function is evaluated in compiled code and gives the same DEs as the Python function"""
+    m_compiled = Model(X0, _compiled_inputs)
+    m_python = Model(X0, _python_inputs)
+    assert m_compiled._compiled_rhs is not None
+    assert m_python._compiled_rhs is None
+    for t in [0., 0.5, 3.]:
+        numpy.testing.assert_array_equal(m_compiled.DEs(t), m_python.DEs(t))
+
+    m_compiled.step(1.)
+    m_python.step(1.)
+    numpy.testing.assert_allclose(m_compiled.X, m_python.X, rtol=1e-12)
+
+
+def test_compiled_inputs_shared(X0):
+    """The compiled right hand side is only built once for an inputs function and is stored on it"""
+    inputs = numba.njit(_python_inputs)
+    rhs = Model(X0, inputs)._compiled_rhs
+    assert Model(X0, inputs)._compiled_rhs is rhs
+    assert Model(X0, numba.njit(_python_inputs))._compiled_rhs is not rhs
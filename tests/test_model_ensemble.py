@@ -0,0 +1,42 @@
+import numpy
+from Model import Model, ModelEnsemble, ensemble_step
+
+
+def _initial_states(X0, K):
+    """`K` initial states spread around `X0`"""
+    return X0 * numpy.linspace(0.8, 1.2, K)[:, None]
+
+
+def test_ensemble_matches_model(inputs, X0):
+    """Each member of an ensemble stepped with a small dt follows its own `Model` past the depletion of Y"""
+    X0s = _initial_states(X0, 4)
+    t_end, dt = 30.0, 0.01
+
+    ensemble = ModelEnsemble(X0s, inputs)
+    for _ in range(int(round(t_end / dt))):
+        ensemble.step(dt)
+    # LSODA controls its own step size, so the models are stepped hourly
+    models = [Model(X, inputs) for X in X0s]
+    for m in models:
+        for _ in range(int(t_end)):
+            m.step(1.0)
+
+    assert numpy.isclose(ensemble.t, t_end)
+    numpy.testing.assert_allclose(ensemble.X, [m.X for m in models], rtol=1e-3, atol=1e-6)
+    assert numpy.all(ensemble.X[:, 10] == 0)
+
+
+def test_ensemble_step_broadcasts(inputs, X0):
+    """`ensemble_step` advances any leading shape of states, each member the same as on its own"""
+    U = numpy.array(inputs(0.5))
+    Rinv = ModelEnsemble(X0, inputs).rate_matrix_inv
+    Xs = _initial_states(X0, 6).reshape(2, 3, -1)
+    work = numpy.empty((5, Xs.shape[-1]))
+
+    Xs_new = ensemble_step(Xs, U, Rinv, 1.0, work)
+    assert Xs_new.shape == Xs.shape
+    for index in numpy.ndindex(Xs.shape[:-1]):
+        numpy.testing.assert_array_equal(Xs_new[index], ensemble_step(Xs[index], U, Rinv, 1.0, work))
+    # The states can be advanced in place
+    ensemble_step(Xs, U, Rinv, 1.0, work, Xs)
+    numpy.testing.assert_array_equal(Xs, Xs_new)
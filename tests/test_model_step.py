@@ -0,0 +1,58 @@
+import time
+import numpy
+import pytest
+from Model import Model
+
+
+def test_step_to_200(inputs, X0):
+    """Steps the model of `simulation.py` to t=200 with a large step, which must not fail.
+    Nz and Ny are depleted on the way and must stop at exactly zero"""
+    m = Model(X0, inputs)
+    for _ in range(40):
+        m.step(5.0)
+    assert numpy.isclose(m.t, 200)
+    assert numpy.all(numpy.isfinite(m.X))
+    assert m.X[9] == 0 and m.X[10] == 0
+    # The history buffers have grown from their initial size to hold every step
+    Xs = m.get_Xs()
+    assert Xs.shape == (41, len(X0))
+    numpy.testing.assert_array_equal(Xs[0], X0)
+    numpy.testing.assert_array_equal(Xs[-1], m.X)
+
+
+def test_step_matches_fine_reference(inputs, X0):
+    """A single LSODA step over a short horizon agrees with fine fixed RK4 steps of the DEs"""
+    t_end, n = 2.0, 2000
+    h = t_end / n
+
+    reference = Model(X0, inputs)
+    for i in range(n):
+        t, X = i * h, reference.X.copy()
+        k1 = reference.DEs(t)
+        reference.X = X + 0.5 * h * k1
+        k2 = reference.DEs(t + 0.5 * h)
+        reference.X = X + 0.5 * h * k2
+        k3 = reference.DEs(t + 0.5 * h)
+        reference.X = X + h * k3
+        k4 = reference.DEs(t + h)
+        reference.X = X + h / 6 * (k1 + 2 * k2 + 2 * k3 + k4)
+
+    m = Model(X0, inputs)
+    m.step(t_end)
+    numpy.testing.assert_allclose(m.X, reference.X, rtol=1e-4, atol=1e-7)
+
+
+
+@pytest.mark.parametrize('V', [0, -0.1, 1e-9])
+def test_step_with_empty_volume(V, inputs, X0):
+    """A clipped or nearly empty volume, e.g. for a UKF sigma point, raises instead of integrating forever"""
+    X = X0.copy()
+    X[11] = V
+    m = Model(X, inputs)
+
+    start = time.perf_counter()
+    with pytest.raises(RuntimeError):
+        m.step(1.0)
+    assert time.perf_counter() - start < 10
+    assert m.t == 0
+    numpy.testing.assert_array_equal(m.X, X)